@@ -1,12 +1,13 @@
 from output_formatter import PythonListFormatter
 
 class DefaultValues:
-    DELIMITER = ["-", "..", "to", "~"]
+    DELIMITER = ("-", "..", "to", "~")
     STEP_DELIMITER = ":"
     ALLOW_REVERSED = True
     ALLOW_MERGED = False
     ALLOW_DEDUPLICATE = False
     OUTPUT_FORMATTER = PythonListFormatter()
+    MEMORY_BUDGET = None
 
 class ErrorMessages:
     # Output formatter errors
@@ -20,6 +21,16 @@ class ErrorMessages:
     STEP_WITH_SINGLE_NUMBER = "Step syntax '{value}' cannot be used with a single number - use with ranges only"
     ZERO_STEP_VALUE = "Step value cannot be zero - must be a non-zero integer"
     
+    # Memory budget errors
+    INVALID_MEMORY_BUDGET = "Invalid memory budget: '{value}' - must be a positive number of bytes"
+    VALUE_OUT_OF_SPILL_RANGE = "Value out of range for memory-budgeted expansion - numbers must fit in a signed 64-bit integer"
+    
+    # Range index errors
+    EXPRESSION_ALREADY_INDEXED = "Expression key already indexed: '{key}' - remove it before adding it again"
+    EXPRESSION_NOT_INDEXED = "Expression key not indexed: '{key}'"
+    INVALID_INDEX_FILE = "Invalid range index file: '{path}' - {reason}"
+    UNSUPPORTED_INDEX_KEY = "Cannot save range index: key {key!r} must be a string or integer"
+    
     @classmethod
     def format_message(cls, message_template: str, **kwargs) -> str:
         """Format an error message with the provided parameters."""
@@ -0,0 +1,4 @@
+class RangeExpanderError(Exception):
+    """Custom exception for range expansion errors."""
+
+    pass
@@ -0,0 +1,104 @@
+import re
+from typing import Iterable, Optional, Pattern, Tuple
+
+from constants import DefaultValues, ErrorMessages
+from exceptions import RangeExpanderError
+from output_formatter import OutputFormatter
+
+_FIELDS = (
+    "delimiters",
+    "step_delimeter",
+    "allow_reversed",
+    "allow_merged",
+    "allow_deduplicate",
+    "output_formatter",
+    "memory_budget",
+)
+
+
+class ExpanderConfig:
+    """Immutable, hashable configuration for NumberRangeExpander.
+
+    A config never changes after construction, so one instance can be shared by
+    any number of threads. Settings are validated and parsing tables derived
+    from them are computed once here instead of on every expand() call. Use
+    replace() to derive a config with different settings. The hash is computed
+    on first use, so configs holding unhashable settings (e.g. a dataclass
+    formatter) still work, they just cannot be hashed.
+    """
+
+    __slots__ = _FIELDS + ("delimiter_pattern", "_hash")
+
+    def __init__(
+        self,
+        delimiters: Iterable[str] = DefaultValues.DELIMITER,
+        step_delimeter: str = DefaultValues.STEP_DELIMITER,
+        allow_reversed: bool = DefaultValues.ALLOW_REVERSED,
+        allow_merged: bool = DefaultValues.ALLOW_MERGED,
+        allow_deduplicate: bool = DefaultValues.ALLOW_DEDUPLICATE,
+        output_formatter: OutputFormatter = DefaultValues.OUTPUT_FORMATTER,
+        memory_budget: Optional[int] = DefaultValues.MEMORY_BUDGET,
+    ):
+        self._validate(memory_budget)
+        delimiters = tuple(delimiters)
+        set_field = object.__setattr__
+        set_field(self, "delimiters", delimiters)
+        set_field(self, "step_delimeter", step_delimeter)
+        set_field(self, "allow_reversed", allow_reversed)
+        set_field(self, "allow_merged", allow_merged)
+        set_field(self, "allow_deduplicate", allow_deduplicate)
+        set_field(self, "output_formatter", output_formatter)
+        set_field(self, "memory_budget", memory_budget)
+
+        # Matches any range delimiter, letting plain numbers skip the delimiter loop
+        pattern: Optional[Pattern[str]] = (
+            re.compile("|".join(map(re.escape, delimiters))) if delimiters else None
+        )
+        set_field(self, "delimiter_pattern", pattern)
+        set_field(self, "_hash", None)
+
+    @staticmethod
+    def _validate(memory_budget: Optional[int]) -> None:
+        """Reject settings that can be checked before any input is expanded."""
+        if memory_budget is not None and (
+            isinstance(memory_budget, bool)
+            or not isinstance(memory_budget, int)
+            or memory_budget <= 0
+        ):
+            message = ErrorMessages.format_message(
+                ErrorMessages.INVALID_MEMORY_BUDGET, value=memory_budget
+            )
+            raise RangeExpanderError(message)
+
+    def _key(self) -> Tuple:
+        return tuple(getattr(self, field) for field in _FIELDS)
+
+    def __setattr__(self, name: str, value) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable - use replace() to change '{name}'")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable - cannot delete '{name}'")
+
+    def __reduce__(self):
+        # Rebuild through __init__ so copy and pickle work despite the frozen __setattr__
+        return type(self), self._key()
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, ExpanderConfig):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self) -> int:
+        if self._hash is None:
+            object.__setattr__(self, "_hash", hash(self._key()))
+        return self._hash
+
+    def __repr__(self) -> str:
+        settings = ", ".join(f"{field}={getattr(self, field)!r}" for field in _FIELDS)
+        return f"{type(self).__name__}({settings})"
+
+    def replace(self, **changes) -> "ExpanderConfig":
+        """Return a new config with the given settings changed."""
+        settings = {field: getattr(self, field) for field in _FIELDS}
+        settings.update(changes)
+        return ExpanderConfig(**settings)
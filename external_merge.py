@@ -0,0 +1,247 @@
+import heapq
+import logging
+import os
+import tempfile
+from array import array
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List
+
+INT64_TYPECODE = "q"
+INT64_SIZE = array(INT64_TYPECODE).itemsize
+# Upper bound on runs merged (and files held open) at once, whatever the budget
+MAX_FAN_IN = 64
+# Peak bytes per buffered entry while a run is sorted: the int64 buffer plus a
+# list slot and a boxed int (values) or packed 128-bit int (pairs), measured
+# with tracemalloc for values near the int64 limits
+SORT_BYTES_PER_VALUE = 56
+SORT_BYTES_PER_PAIR = 72
+# Fixed bytes per run being merged (open file, reader generator, heap entry)
+MERGE_BYTES_PER_RUN = 1024
+# Pairs sort as one int: key and payload are shifted to be non-negative, then
+# packed as key << 64 | payload
+PAIR_OFFSET = 1 << 63
+PAIR_SHIFT = 64
+PAIR_MASK = (1 << PAIR_SHIFT) - 1
+
+
+def _write_all(handle, chunk: array) -> None:
+    """Write an int64 array to an unbuffered file, retrying short writes."""
+    view = memoryview(chunk.tobytes())
+    while view:
+        view = view[handle.write(view):]
+
+
+class _RunStore:
+    """Buffer int64 entries and spill them as sorted runs within ``memory_budget`` bytes.
+
+    Entries are plain integers when ``width`` is 1 and ``(key, payload)`` pairs when
+    ``width`` is 2; pairs are stored interleaved in the same int64 array.
+    """
+
+    def __init__(self, memory_budget: int, width: int, directory: str):
+        self.width = width
+        self.directory = directory
+        self.buffer = array(INT64_TYPECODE)
+        self.runs: List[str] = []
+        # Sorting boxes every entry, so it sets how many entries can be buffered
+        sort_bytes = SORT_BYTES_PER_VALUE if width == 1 else SORT_BYTES_PER_PAIR
+        self.capacity = max(1, memory_budget // sort_bytes)
+        # Merging keeps entries as int64: each merge reads at most fan_in runs,
+        # plus one output block for intermediate passes. At most half the budget
+        # goes on per-run overhead, the rest on read/write blocks
+        self.fan_in = max(2, min(MAX_FAN_IN, memory_budget // (2 * MERGE_BYTES_PER_RUN)))
+        block_bytes = memory_budget - self.fan_in * MERGE_BYTES_PER_RUN
+        self.block = max(1, block_bytes // ((self.fan_in + 1) * width * INT64_SIZE))
+
+    def add(self, entry) -> None:
+        """Buffer a single entry, spilling a run when the buffer is full."""
+        if self.width == 1:
+            self.buffer.append(entry)
+        else:
+            self.buffer.extend(entry)
+        if len(self.buffer) >= self.capacity * self.width:
+            self.spill()
+
+    def extend(self, values: Iterable[int]) -> None:
+        """Buffer plain integers in chunks that fit the remaining capacity."""
+        values = iter(values)
+        while True:
+            before = len(self.buffer)
+            self.buffer.extend(islice(values, self.capacity - before))
+            if len(self.buffer) == before:
+                return
+            if len(self.buffer) >= self.capacity:
+                self.spill()
+
+    def _sorted_keys(self) -> List[int]:
+        """Sort the buffered entries in place as a list of keys, releasing the buffer."""
+        if self.width == 1:
+            keys = self.buffer.tolist()
+        else:
+            entries = iter(self.buffer)
+            keys = [
+                (key + PAIR_OFFSET) << PAIR_SHIFT | (payload + PAIR_OFFSET)
+                for key, payload in zip(entries, entries)
+            ]
+        self.buffer = array(INT64_TYPECODE)
+        keys.sort()
+        return keys
+
+    def _unpack(self, keys: List[int]) -> Iterator:
+        """Iterate the entries encoded by sorted keys."""
+        if self.width == 1:
+            return iter(keys)
+        return (
+            ((key >> PAIR_SHIFT) - PAIR_OFFSET, (key & PAIR_MASK) - PAIR_OFFSET)
+            for key in keys
+        )
+
+    def _entries(self, chunk: array) -> Iterator:
+        """Iterate the entries stored in an int64 array."""
+        entries = iter(chunk)
+        if self.width == 1:
+            return entries
+        return zip(entries, entries)
+
+    def spill(self) -> None:
+        """Sort the buffer and write it to a temporary file as a new run."""
+        if not self.buffer:
+            return
+        keys = self._sorted_keys()
+        fd, path = tempfile.mkstemp(suffix=".run", dir=self.directory)
+        with os.fdopen(fd, "wb", buffering=0) as handle:
+            self._write_entries(handle, self._unpack(keys))
+        self.runs.append(path)
+        logging.debug(f"Spilled run of {len(keys)} entries to {path}")
+
+    def _read_run(self, path: str) -> Iterator:
+        """Stream the entries of a spilled run, ``self.block`` entries at a time."""
+        size = self.block * self.width * INT64_SIZE
+        # Unbuffered, so the only read buffer is the block counted in the budget
+        with open(path, "rb", buffering=0) as handle:
+            while True:
+                chunk = array(INT64_TYPECODE)
+                while len(chunk) * INT64_SIZE < size:
+                    # Read straight into the chunk so no bytes copy stays alive
+                    data = handle.read(size - len(chunk) * INT64_SIZE)
+                    if not data:
+                        break
+                    chunk.frombytes(data)
+                    del data
+                if not chunk:
+                    return
+                yield from self._entries(chunk)
+
+    def _write_entries(self, handle, entries: Iterable) -> None:
+        """Write entries to an unbuffered file, ``self.block`` entries at a time."""
+        chunk = array(INT64_TYPECODE)
+        for entry in entries:
+            if self.width == 1:
+                chunk.append(entry)
+            else:
+                chunk.extend(entry)
+            if len(chunk) >= self.block * self.width:
+                _write_all(handle, chunk)
+                chunk = array(INT64_TYPECODE)
+        _write_all(handle, chunk)
+
+    def _merge_runs(self, paths: List[str]) -> str:
+        """Merge several runs into a single new run file, removing the inputs."""
+        fd, path = tempfile.mkstemp(suffix=".run", dir=self.directory)
+        with os.fdopen(fd, "wb", buffering=0) as handle:
+            self._write_entries(handle, heapq.merge(*(self._read_run(run) for run in paths)))
+        for run in paths:
+            os.remove(run)
+        return path
+
+    def merged(self) -> Iterator:
+        """Iterate all buffered and spilled entries in sorted order."""
+        if not self.runs:
+            return self._unpack(self._sorted_keys())
+
+        self.spill()
+        # Merge groups of at most fan_in runs until a single pass can finish the job
+        while len(self.runs) > self.fan_in:
+            logging.debug(f"Merging {len(self.runs)} runs in groups of {self.fan_in}")
+            self.runs = [
+                self._merge_runs(self.runs[start : start + self.fan_in])
+                for start in range(0, len(self.runs), self.fan_in)
+            ]
+        return heapq.merge(*(self._read_run(path) for path in self.runs))
+
+
+def _drop_repeats(entries: Iterable, key: Callable = lambda entry: entry) -> Iterator:
+    """Yield the first entry of each run of entries sharing the same key."""
+    previous = object()
+    for entry in entries:
+        current = key(entry)
+        if current != previous:
+            previous = current
+            yield entry
+
+
+class SpillingMerger:
+    """Sort and/or deduplicate integers within a fixed memory budget.
+
+    Values are buffered as int64 in memory; whenever sorting the buffer would
+    exceed ``memory_budget`` bytes it is sorted and spilled to a temporary file.
+    Iterating the merger streams the result through an external k-way merge of
+    those runs. The budget covers the merger's own buffers, not the caller's input
+    or output.
+
+    With ``sort=False`` the original input order is kept: values are tagged with
+    their position, merged by value (dropping later duplicates when
+    ``deduplicate`` is set) and then merged back into position order. The two
+    phases run at the same time, so each gets half of the budget.
+    """
+
+    def __init__(self, memory_budget: int, sort: bool = True, deduplicate: bool = False):
+        self.sort = sort
+        self.deduplicate = deduplicate
+        width = 1 if sort else 2
+        phases = 1 if sort else 2
+        self._phase_budget = memory_budget // phases
+        self._directory = tempfile.TemporaryDirectory(prefix="range_expander_")
+        self._store = _RunStore(self._phase_budget, width, self._directory.name)
+        self._position = 0
+
+    def __enter__(self) -> "SpillingMerger":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Remove all spilled runs."""
+        self._directory.cleanup()
+
+    def extend(self, values: Iterable[int]) -> None:
+        """Add values, spilling sorted runs to disk as the budget is reached.
+
+        Raises OverflowError if a value does not fit in a signed 64-bit integer.
+        """
+        if self.sort:
+            self._store.extend(values)
+            return
+        for value in values:
+            self._store.add((value, self._position))
+            self._position += 1
+
+    def __iter__(self) -> Iterator[int]:
+        if self.sort:
+            merged = self._store.merged()
+            return _drop_repeats(merged) if self.deduplicate else merged
+        return self._iter_in_input_order()
+
+    def _iter_in_input_order(self) -> Iterator[int]:
+        """Merge (value, position) runs by value, then back into position order."""
+        entries = self._store.merged()
+        if self.deduplicate:
+            # Sorted by (value, position), so the first entry per value is its earliest
+            entries = _drop_repeats(entries, key=lambda entry: entry[0])
+
+        by_position = _RunStore(self._phase_budget, 2, self._directory.name)
+        for value, position in entries:
+            by_position.add((position, value))
+        for _, value in by_position.merged():
+            yield value
@@ -1,5 +1,10 @@
 import logging
-from typing import List, Optional, Union, Set
+import re
+import threading
+from typing import Iterable, Iterator, List, Optional, Sequence, Union, Set
+from exceptions import RangeExpanderError
+from expander_config import ExpanderConfig
+from external_merge import SpillingMerger
 from output_formatter import (
     OutputFormatter,
     CsvStringFormatter,
@@ -8,38 +13,93 @@ from output_formatter import (
 )
 from constants import DefaultValues, ErrorMessages
 
+# Comma-separated parts, matched one at a time so the input is never split into a list
+PART_PATTERN = re.compile(r"[^,]+")
+
 # Configure logging
 logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
 
-class RangeExpanderError(Exception):
-    """Custom exception for range expansion errors."""
+# Marks constructor settings that were not passed explicitly
+_UNSET = object()
+
+
+def _config_property(name: str) -> property:
+    """Expose a config setting as an attribute; assigning it swaps in a new config."""
+
+    def getter(self):
+        return getattr(self._config, name)
 
-    pass
+    def setter(self, value):
+        with self._config_lock:
+            self._config = self._config.replace(**{name: value})
+
+    return property(getter, setter, doc=f"The '{name}' setting of the current config.")
 
 
 class NumberRangeExpander:
+    """Expand number range strings according to an immutable ExpanderConfig.
+
+    expand() reads the config once per call and never mutates the expander, so a
+    single instance can be shared across threads. Assigning a setting attribute
+    atomically replaces the config; calls already running keep the old one.
+    """
+
+    delimiters = _config_property("delimiters")
+    step_delimeter = _config_property("step_delimeter")
+    allow_reversed = _config_property("allow_reversed")
+    allow_merged = _config_property("allow_merged")
+    allow_deduplicate = _config_property("allow_deduplicate")
+    output_formatter = _config_property("output_formatter")
+    memory_budget = _config_property("memory_budget")
+
     def __init__(
         self,
-        delimiters: List[str] = DefaultValues.DELIMITER,
-        step_delimeter: str = DefaultValues.STEP_DELIMITER,
-        allow_reversed: bool = DefaultValues.ALLOW_REVERSED,
-        allow_merged: bool = DefaultValues.ALLOW_MERGED,
-        allow_deduplicate: bool = DefaultValues.ALLOW_DEDUPLICATE,
-        output_formatter: OutputFormatter = DefaultValues.OUTPUT_FORMATTER,
+        delimiters: Iterable[str] = _UNSET,
+        step_delimeter: str = _UNSET,
+        allow_reversed: bool = _UNSET,
+        allow_merged: bool = _UNSET,
+        allow_deduplicate: bool = _UNSET,
+        output_formatter: OutputFormatter = _UNSET,
+        memory_budget: Optional[int] = _UNSET,
+        config: Optional[ExpanderConfig] = None,
     ):
-        self.delimiters = delimiters
-        self.step_delimeter = step_delimeter
-        self.allow_reversed = allow_reversed
-        self.allow_merged = allow_merged
-        self.allow_deduplicate = allow_deduplicate
-        self.output_formatter = output_formatter
+        """Create an expander from a shared config and/or individual settings.
+
+        Settings that are not passed come from ``config`` if given, otherwise from
+        DefaultValues; settings that are passed override the config's values.
+        """
+        settings = {
+            name: value
+            for name, value in (
+                ("delimiters", delimiters),
+                ("step_delimeter", step_delimeter),
+                ("allow_reversed", allow_reversed),
+                ("allow_merged", allow_merged),
+                ("allow_deduplicate", allow_deduplicate),
+                ("output_formatter", output_formatter),
+                ("memory_budget", memory_budget),
+            )
+            if value is not _UNSET
+        }
+        if config is None:
+            config = ExpanderConfig(**settings)
+        elif settings:
+            config = config.replace(**settings)
+        self._config = config
+        self._config_lock = threading.Lock()
         logging.info(
-            f"Initialized NumberRangeExpander with delimiters: {self.delimiters}, "
-            f"step_delimiter: '{self.step_delimeter}', allow_reversed: {self.allow_reversed}, "
-            f"allow_merged: {self.allow_merged}, allow_deduplicate: {self.allow_deduplicate}, "
-            f"output_formatter: {type(self.output_formatter).__name__}"
+            f"Initialized NumberRangeExpander with delimiters: {list(config.delimiters)}, "
+            f"step_delimiter: '{config.step_delimeter}', allow_reversed: {config.allow_reversed}, "
+            f"allow_merged: {config.allow_merged}, allow_deduplicate: {config.allow_deduplicate}, "
+            f"output_formatter: {type(config.output_formatter).__name__}, "
+            f"memory_budget: {config.memory_budget}"
         )
 
+    @property
+    def config(self) -> ExpanderConfig:
+        """The current immutable configuration."""
+        return self._config
+
     def _parse_number(self, value: str) -> int:
         """Parse a string to an integer, raising an error if invalid."""
         try:
@@ -51,36 +111,40 @@ class NumberRangeExpander:
             )
             raise RangeExpanderError(message)
 
-    def _expand_range(self, start: int, end: int, step: int = 1) -> List[int]:
-        """Expand a range from start to end with a given step."""
+    def _expand_range(
+        self, config: ExpanderConfig, start: int, end: int, step: int = 1
+    ) -> range:
+        """Expand a range from start to end with a given step, lazily as a range object."""
         if step == 0:
             message = ErrorMessages.format_message(
                 ErrorMessages.ZERO_STEP_VALUE
             )
             raise RangeExpanderError(message)
         elif start == end:
-            return [start]
+            return range(start, start + 1)
         elif start > end:
-            if self.allow_reversed:
+            if config.allow_reversed:
                 # For reversed ranges, we need to handle step correctly
                 if step > 0:
                     # If step is positive but range is reversed, we need to go backwards
-                    return list(range(start, end - 1, -step))
+                    return range(start, end - 1, -step)
                 else:
                     # If step is negative, we can use it directly
-                    return list(range(start, end - 1, step))
+                    return range(start, end - 1, step)
             else:
                 message = ErrorMessages.format_message(
                     ErrorMessages.REVERSED_RANGE_NOT_ALLOWED, start=start, end=end
                 )
                 raise RangeExpanderError(message)
-        return list(range(start, end + 1, step))
+        return range(start, end + 1, step)
 
-    def _parse_range(self, part: str) -> Optional[List[int]]:
+    def _parse_range(
+        self, config: ExpanderConfig, part: str
+    ) -> Optional[Sequence[int]]:
         """Parse a part of the input string to extract a range or single number."""
         step = 1
-        if self.step_delimeter in part:
-            part_split = part.split(self.step_delimeter)
+        if config.step_delimeter in part:
+            part_split = part.split(config.step_delimeter)
             if len(part_split) != 2 or len(part) == 2:
                 message = ErrorMessages.format_message(
                     ErrorMessages.STEP_WITH_SINGLE_NUMBER, value=part
@@ -95,8 +159,12 @@ class NumberRangeExpander:
                 raise RangeExpanderError(message)
             part = part_split[0].strip()
     
+        # Plain numbers contain no delimiter, so skip trying each one in turn
+        if config.delimiter_pattern is None or not config.delimiter_pattern.search(part):
+            return None
+
         exception = None
-        for index, delimiter in enumerate(self.delimiters):
+        for index, delimiter in enumerate(config.delimiters):
             # Check if delimiter is in the part
             if delimiter not in part:
                 continue
@@ -131,13 +199,13 @@ class NumberRangeExpander:
                         start_str = part[:dash_index]
                         end_str = part[dash_index + 1 :]
                         start, end = map(self._parse_number, [start_str, end_str])
-                        return self._expand_range(start, end, step)
+                        return self._expand_range(config, start, end, step)
                 elif len(parts_split) == 2 and parts_split[0].strip():
                     start, end = map(self._parse_number, parts_split)
-                    return self._expand_range(start, end, step)
+                    return self._expand_range(config, start, end, step)
             except Exception as e:
                 exception = e
-                if index < len(self.delimiters) - 1:
+                if index < len(config.delimiters) - 1:
                     logging.debug(f"Delimiter '{delimiter}' failed: {e}")
                     continue
                 
@@ -146,21 +214,35 @@ class NumberRangeExpander:
         if exception:
             raise exception
     
-    def _parse_part(self, part: str) -> List[int]:
+    def _parse_part(self, config: ExpanderConfig, part: str) -> Sequence[int]:
         """Parse a part of the input string to extract numbers or ranges."""
-        range_check = self._parse_range(part)
+        range_check = self._parse_range(config, part)
         if range_check != None:
             return range_check
 
-        return [self._parse_number(part)]
+        number = self._parse_number(part)
+        return range(number, number + 1)
+
+    def _split_parts(self, input_string: str) -> Iterator[str]:
+        """Split an input string on commas, skipping empty parts."""
+        # generator expression for lazy loading
+        parts = (match.group().strip() for match in PART_PATTERN.finditer(input_string))
+        return (part for part in parts if part)
+
+    def parse(self, input_string: str) -> List[range]:
+        """Parse a string into one range object per part, without expanding them."""
+        if not input_string:
+            return []
+        config = self._config
+        return [self._parse_part(config, part) for part in self._split_parts(input_string)]
 
     def _format_output(
-        self, expanded_numbers: List[int]
+        self, config: ExpanderConfig, expanded_numbers: Iterable[int]
     ) -> Union[List[int], Set[int], str]:
         """Format the expanded numbers using the specified output formatter."""
         logging.debug(f"Formatting output: {expanded_numbers}")
-        if isinstance(self.output_formatter, OutputFormatter):
-            return self.output_formatter.format(expanded_numbers)
+        if isinstance(config.output_formatter, OutputFormatter):
+            return config.output_formatter.format(expanded_numbers)
         else:
             message = ErrorMessages.format_message(
                 ErrorMessages.INVALID_OUTPUT_FORMATTER
@@ -172,23 +254,28 @@ class NumberRangeExpander:
         if not input_string:
             return []
 
-        # generator expression for lazy loading
-        input_string = (
-            part.strip() for part in input_string.split(",") if part.strip()
-        )
+        # Snapshot the config so concurrent attribute updates cannot affect this call
+        config = self._config
+        input_string = self._split_parts(input_string)
+
+        # Spill to disk only when results must be sorted or deduplicated
+        if config.memory_budget is not None and (
+            config.allow_merged or config.allow_deduplicate
+        ):
+            return self._expand_with_budget(config, input_string)
 
         expanded_numbers = []
         for part in input_string:
             try:
                 logging.debug(f"Processing part: {part}")
-                expanded_part = self._parse_part(part)
+                expanded_part = self._parse_part(config, part)
                 expanded_numbers.extend(expanded_part)
                 
             except RangeExpanderError as e:
                 raise e
         
         # Remove duplicates if allowed
-        if self.allow_deduplicate:
+        if config.allow_deduplicate:
             seen = set()
             unique_numbers = []
             for num in expanded_numbers:
@@ -198,10 +285,32 @@ class NumberRangeExpander:
             expanded_numbers = unique_numbers
         
         # Sort the numbers if merged ranges are allowed
-        if self.allow_merged:
+        if config.allow_merged:
             expanded_numbers.sort()
 
-        return self._format_output(expanded_numbers)
+        return self._format_output(config, expanded_numbers)
+
+    def _expand_with_budget(
+        self, config: ExpanderConfig, parts: Iterable[str]
+    ) -> Union[List[int], Set[int], str]:
+        """Expand parts within memory_budget bytes, merging spilled runs from disk."""
+        with SpillingMerger(
+            config.memory_budget,
+            sort=config.allow_merged,
+            deduplicate=config.allow_deduplicate,
+        ) as merger:
+            for part in parts:
+                logging.debug(f"Processing part: {part}")
+                try:
+                    merger.extend(self._parse_part(config, part))
+                except OverflowError:
+                    message = ErrorMessages.format_message(
+                        ErrorMessages.VALUE_OUT_OF_SPILL_RANGE
+                    )
+                    raise RangeExpanderError(message)
+
+            # Format while the spilled runs still exist so output streams from disk
+            return self._format_output(config, merger)
 
 
 if __name__ == "__main__":
@@ -247,6 +356,13 @@ if __name__ == "__main__":
         help="Allow deduplication of numbers",
     )
 
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        default=None,
+        help="Memory budget in bytes for merging/deduplication; spills to disk when exceeded",
+    )
+
     parser.add_argument(
         "--output-formatter",
         "-f",
@@ -263,6 +379,7 @@ if __name__ == "__main__":
             allow_reversed=args.allow_reversed,
             allow_merged=args.allow_merged,
             allow_deduplicate=args.allow_deduplicate,
+            memory_budget=args.memory_budget,
             output_formatter=(
                 CsvStringFormatter()
                 if args.output_formatter == "csv"
@@ -1,23 +1,44 @@
 from abc import ABC, abstractmethod
-from typing import List, Set, Union
+from typing import Iterable, List, Set, Union
 
 class OutputFormatter(ABC):
     @abstractmethod
-    def format(self, data: List[int]) -> Union[List[int], Set[int], str]:
+    def format(self, data: Iterable[int]) -> Union[List[int], Set[int], str]:
         """Format the expanded range data into the appropriate format."""
         pass
 
 class CsvStringFormatter(OutputFormatter):
-    def format(self, data: List[int]) -> str:
+    # Stateless, so every instance of this class formats identically
+    def __eq__(self, other) -> bool:
+        return type(self) is type(other)
+
+    def __hash__(self) -> int:
+        return hash(type(self))
+
+    def format(self, data: Iterable[int]) -> str:
         """Format the expanded range data as a CSV string."""
         return ','.join(map(str, data))
     
 class PythonListFormatter(OutputFormatter):
-    def format(self, data: List[int]) -> List[int]:
+    # Stateless, so every instance of this class formats identically
+    def __eq__(self, other) -> bool:
+        return type(self) is type(other)
+
+    def __hash__(self) -> int:
+        return hash(type(self))
+
+    def format(self, data: Iterable[int]) -> List[int]:
         """Format the expanded range data as a Python list."""
-        return data
+        return data if isinstance(data, list) else list(data)
     
 class PythonSetFormatter(OutputFormatter):
-    def format(self, data: List[int]) -> Set[int]:
+    # Stateless, so every instance of this class formats identically
+    def __eq__(self, other) -> bool:
+        return type(self) is type(other)
+
+    def __hash__(self) -> int:
+        return hash(type(self))
+
+    def format(self, data: Iterable[int]) -> Set[int]:
         """Format the expanded range data as a Python set."""
-        return set(data)
\ No newline at end of file
+        return set(data)
@@ -0,0 +1,394 @@
+import json
+import logging
+import math
+from bisect import bisect_left, insort
+from typing import Dict, Hashable, Iterable, List, Mapping, Optional, Set, Tuple, Union
+
+from constants import ErrorMessages
+from number_range_expander import NumberRangeExpander, RangeExpanderError
+
+INDEX_FORMAT = "range_index"
+INDEX_VERSION = 1
+# Scapegoat balance factor: a child may hold at most this share of its parent's intervals
+BALANCE_ALPHA = 2 / 3
+
+# (lowest value, highest value, step) of an ascending arithmetic progression
+Interval = Tuple[int, int, int]
+
+
+def _to_interval(values: range) -> Optional[Interval]:
+    """Normalise a parsed range into an ascending (low, high, step) interval."""
+    if not values:
+        return None
+    low, high = sorted((values[0], values[-1]))
+    step = abs(values.step) if len(values) > 1 else 1
+    return low, high, step
+
+
+def _contains(interval: Interval, value: int) -> bool:
+    """Check whether a value is one of the interval's members."""
+    low, high, step = interval
+    return low <= value <= high and (value - low) % step == 0
+
+
+def _intersects(interval: Interval, start: int, end: int) -> bool:
+    """Check whether any of the interval's members lies within [start, end]."""
+    low, high, step = interval
+    first = max(low, start)
+    # Round up to the next member of the progression
+    first = low + -(-(first - low) // step) * step
+    return first <= min(high, end)
+
+
+def _is_persistable_key(key) -> bool:
+    """Check whether a key survives a JSON round trip unchanged."""
+    return isinstance(key, (str, int)) and not isinstance(key, bool)
+
+
+def _is_valid_interval(interval) -> bool:
+    """Check that a loaded interval is an ascending (low, high, step) triple of ints."""
+    if len(interval) != 3 or not all(
+        isinstance(bound, int) and not isinstance(bound, bool) for bound in interval
+    ):
+        return False
+    low, high, step = interval
+    return low <= high and step >= 1
+
+
+class _Node:
+    """Centered interval tree node holding every interval that spans its center."""
+
+    __slots__ = ("center", "by_start", "by_end", "left", "right")
+
+    def __init__(self, center: int):
+        self.center = center
+        # (low, high, step, uid) sorted ascending by low
+        self.by_start: List[Tuple[int, int, int, int]] = []
+        # (high, low, step, uid) sorted ascending by high
+        self.by_end: List[Tuple[int, int, int, int]] = []
+        self.left: Optional["_Node"] = None
+        self.right: Optional["_Node"] = None
+
+    def add(self, uid: int, interval: Interval) -> None:
+        low, high, step = interval
+        insort(self.by_start, (low, high, step, uid))
+        insort(self.by_end, (high, low, step, uid))
+
+    def discard(self, uid: int, interval: Interval) -> None:
+        low, high, step = interval
+        for entries, entry in (
+            (self.by_start, (low, high, step, uid)),
+            (self.by_end, (high, low, step, uid)),
+        ):
+            del entries[bisect_left(entries, entry)]
+
+
+class RangeIndex:
+    """Reverse lookup index answering which stored expressions contain a number.
+
+    Each expression is parsed (not expanded) into stepped intervals, which are
+    stored in a centered interval tree. Point and range stabbing queries visit
+    O(log n + k) nodes and entries, where k is the number of intervals whose
+    bounds overlap the query; stepped intervals are then filtered by membership.
+
+    Incremental adds update the tree in place, scapegoat style: when a new node
+    lands deeper than log base 1/BALANCE_ALPHA of the interval count, the
+    highest unbalanced subtree on its path is rebuilt, keeping the depth
+    O(log n) at an amortised O(log n) cost per add. Removes empty nodes in place
+    and trigger a full rebuild once more intervals have been removed than remain.
+    """
+
+    def __init__(self, expander: Optional[NumberRangeExpander] = None):
+        self.expander = expander or NumberRangeExpander()
+        self._expressions: Dict[Hashable, str] = {}
+        self._uids: Dict[Hashable, List[int]] = {}
+        self._intervals: Dict[int, Interval] = {}
+        self._owners: Dict[int, Hashable] = {}
+        self._next_uid = 0
+        self._root: Optional[_Node] = None
+        self._removed = 0
+
+    @classmethod
+    def build(
+        cls,
+        expressions: Union[Mapping[Hashable, str], Iterable[Tuple[Hashable, str]]],
+        expander: Optional[NumberRangeExpander] = None,
+    ) -> "RangeIndex":
+        """Bulk build an index from a mapping or pairs of key to expression."""
+        index = cls(expander)
+        items = expressions.items() if isinstance(expressions, Mapping) else expressions
+        for key, expression in items:
+            index._store(key, expression, index._parse(expression))
+        index._rebuild()
+        return index
+
+    def __len__(self) -> int:
+        return len(self._expressions)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._expressions
+
+    def expression(self, key: Hashable) -> str:
+        """Return the stored expression for a key."""
+        self._require(key)
+        return self._expressions[key]
+
+    def add(self, key: Hashable, expression: str) -> None:
+        """Index a new expression under the given key."""
+        uids = self._store(key, expression, self._parse(expression))
+        for uid in uids:
+            self._insert(uid, self._intervals[uid])
+
+    def remove(self, key: Hashable) -> None:
+        """Remove the expression stored under the given key."""
+        self._require(key)
+        uids = self._uids.pop(key)
+        del self._expressions[key]
+        for uid in uids:
+            self._delete(uid, self._intervals.pop(uid))
+            del self._owners[uid]
+        self._removed += len(uids)
+        if self._removed > max(len(self._intervals), 32):
+            self._rebuild()
+
+    def lookup(self, value: int) -> Set[Hashable]:
+        """Return the keys of all expressions that contain the value."""
+        matches = set()
+        node = self._root
+        while node is not None:
+            if value < node.center:
+                for low, high, step, uid in node.by_start:
+                    if low > value:
+                        break
+                    if _contains((low, high, step), value):
+                        matches.add(self._owners[uid])
+                node = node.left
+            elif value > node.center:
+                for high, low, step, uid in reversed(node.by_end):
+                    if high < value:
+                        break
+                    if _contains((low, high, step), value):
+                        matches.add(self._owners[uid])
+                node = node.right
+            else:
+                for low, high, step, uid in node.by_start:
+                    if _contains((low, high, step), value):
+                        matches.add(self._owners[uid])
+                break
+        return matches
+
+    def lookup_range(self, start: int, end: int) -> Set[Hashable]:
+        """Return the keys of all expressions containing any value in [start, end]."""
+        if start > end:
+            start, end = end, start
+        matches = set()
+        pending = [self._root]
+        while pending:
+            node = pending.pop()
+            if node is None:
+                continue
+            if end < node.center:
+                for low, high, step, uid in node.by_start:
+                    if low > end:
+                        break
+                    if _intersects((low, high, step), start, end):
+                        matches.add(self._owners[uid])
+                pending.append(node.left)
+            elif start > node.center:
+                for high, low, step, uid in reversed(node.by_end):
+                    if high < start:
+                        break
+                    if _intersects((low, high, step), start, end):
+                        matches.add(self._owners[uid])
+                pending.append(node.right)
+            else:
+                for low, high, step, uid in node.by_start:
+                    if _intersects((low, high, step), start, end):
+                        matches.add(self._owners[uid])
+                pending.extend((node.left, node.right))
+        return matches
+
+    def save(self, path: str) -> None:
+        """Persist the index to a JSON file; keys must be strings or integers."""
+        for key in self._expressions:
+            if not _is_persistable_key(key):
+                message = ErrorMessages.format_message(
+                    ErrorMessages.UNSUPPORTED_INDEX_KEY, key=key
+                )
+                raise RangeExpanderError(message)
+
+        entries = [
+            {
+                "key": key,
+                "expression": expression,
+                "intervals": [list(self._intervals[uid]) for uid in self._uids[key]],
+            }
+            for key, expression in self._expressions.items()
+        ]
+        with open(path, "w", encoding="utf-8") as handle:
+            json.dump(
+                {"format": INDEX_FORMAT, "version": INDEX_VERSION, "entries": entries},
+                handle,
+            )
+        logging.info(f"Saved range index with {len(entries)} expressions to {path}")
+
+    @classmethod
+    def load(
+        cls, path: str, expander: Optional[NumberRangeExpander] = None
+    ) -> "RangeIndex":
+        """Load an index saved with save(), without re-parsing the expressions."""
+        try:
+            with open(path, encoding="utf-8") as handle:
+                data = json.load(handle)
+            if data.get("format") != INDEX_FORMAT or data.get("version") != INDEX_VERSION:
+                raise ValueError("unsupported format or version")
+            index = cls(expander)
+            for entry in data["entries"]:
+                if not _is_persistable_key(entry["key"]):
+                    raise ValueError(f"key {entry['key']!r} must be a string or integer")
+                if not isinstance(entry["expression"], str):
+                    raise ValueError(f"expression for key {entry['key']!r} must be a string")
+                intervals = [tuple(interval) for interval in entry["intervals"]]
+                if not all(_is_valid_interval(interval) for interval in intervals):
+                    raise ValueError(
+                        "intervals must be [low, high, step] integers with low <= high and step >= 1"
+                    )
+                index._store(entry["key"], entry["expression"], intervals)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            message = ErrorMessages.format_message(
+                ErrorMessages.INVALID_INDEX_FILE, path=path, reason=e
+            )
+            raise RangeExpanderError(message)
+        index._rebuild()
+        return index
+
+    def _parse(self, expression: str) -> List[Interval]:
+        """Parse an expression into intervals using the configured expander."""
+        intervals = (_to_interval(values) for values in self.expander.parse(expression))
+        return [interval for interval in intervals if interval is not None]
+
+    def _require(self, key: Hashable) -> None:
+        if key not in self._expressions:
+            message = ErrorMessages.format_message(
+                ErrorMessages.EXPRESSION_NOT_INDEXED, key=key
+            )
+            raise RangeExpanderError(message)
+
+    def _store(
+        self, key: Hashable, expression: str, intervals: List[Interval]
+    ) -> List[int]:
+        """Record an expression and its intervals, returning the new interval ids."""
+        if key in self._expressions:
+            message = ErrorMessages.format_message(
+                ErrorMessages.EXPRESSION_ALREADY_INDEXED, key=key
+            )
+            raise RangeExpanderError(message)
+        uids = list(range(self._next_uid, self._next_uid + len(intervals)))
+        self._next_uid += len(intervals)
+        self._expressions[key] = expression
+        self._uids[key] = uids
+        for uid, interval in zip(uids, intervals):
+            self._intervals[uid] = interval
+            self._owners[uid] = key
+        return uids
+
+    def _insert(self, uid: int, interval: Interval) -> None:
+        low, high, _ = interval
+        # (node, side) pairs from the root down to where the interval belongs
+        path: List[Tuple[_Node, str]] = []
+        node = self._root
+        while node is not None:
+            if high < node.center:
+                path.append((node, "left"))
+                node = node.left
+            elif low > node.center:
+                path.append((node, "right"))
+                node = node.right
+            else:
+                node.add(uid, interval)
+                return
+
+        leaf = _Node(low + (high - low) // 2)
+        leaf.add(uid, interval)
+        if not path:
+            self._root = leaf
+            return
+        parent, side = path[-1]
+        setattr(parent, side, leaf)
+        if len(path) > math.log(len(self._intervals), 1 / BALANCE_ALPHA):
+            self._rebuild_scapegoat(path, leaf)
+
+    def _rebuild_scapegoat(self, path: List[Tuple[_Node, str]], leaf: _Node) -> None:
+        """Rebuild the highest-weight unbalanced subtree on the path to a new leaf."""
+        child_size = 1
+        for depth in range(len(path) - 1, -1, -1):
+            node, side = path[depth]
+            sibling = node.right if side == "left" else node.left
+            size = child_size + len(node.by_start) + self._subtree_size(sibling)
+            if child_size > BALANCE_ALPHA * size:
+                rebuilt = self._build_node(self._subtree_items(node))
+                if depth == 0:
+                    self._root = rebuilt
+                else:
+                    parent, parent_side = path[depth - 1]
+                    setattr(parent, parent_side, rebuilt)
+                logging.debug(f"Rebuilt range index subtree with {size} intervals")
+                return
+            child_size = size
+        # Only nodes emptied by removals can hide the imbalance; start afresh
+        self._rebuild()
+
+    @staticmethod
+    def _subtree_nodes(node: Optional[_Node]) -> Iterable[_Node]:
+        pending = [node]
+        while pending:
+            node = pending.pop()
+            if node is not None:
+                yield node
+                pending.extend((node.left, node.right))
+
+    def _subtree_size(self, node: Optional[_Node]) -> int:
+        """Count the intervals stored in a subtree."""
+        return sum(len(member.by_start) for member in self._subtree_nodes(node))
+
+    def _subtree_items(self, node: _Node) -> List[Tuple[int, Interval]]:
+        """Collect (uid, interval) pairs stored in a subtree."""
+        return [
+            (uid, (low, high, step))
+            for member in self._subtree_nodes(node)
+            for low, high, step, uid in member.by_start
+        ]
+
+    def _delete(self, uid: int, interval: Interval) -> None:
+        low, high, _ = interval
+        node = self._root
+        while high < node.center or low > node.center:
+            node = node.left if high < node.center else node.right
+        node.discard(uid, interval)
+
+    def _rebuild(self) -> None:
+        """Bulk build a balanced tree from all stored intervals."""
+        self._root = self._build_node(list(self._intervals.items()))
+        self._removed = 0
+        logging.debug(f"Rebuilt range index with {len(self._intervals)} intervals")
+
+    def _build_node(self, items: List[Tuple[int, Interval]]) -> Optional[_Node]:
+        if not items:
+            return None
+        endpoints = sorted(bound for _, (low, high, _) in items for bound in (low, high))
+        node = _Node(endpoints[len(endpoints) // 2])
+        left, right = [], []
+        for uid, interval in items:
+            low, high, step = interval
+            if high < node.center:
+                left.append((uid, interval))
+            elif low > node.center:
+                right.append((uid, interval))
+            else:
+                node.by_start.append((low, high, step, uid))
+                node.by_end.append((high, low, step, uid))
+        node.by_start.sort()
+        node.by_end.sort()
+        node.left = self._build_node(left)
+        node.right = self._build_node(right)
+        return node
@@ -1,6 +1,30 @@
+import copy
+import json
+import logging
+import math
+import os
+import pickle
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from unittest import mock
+import external_merge
+from expander_config import ExpanderConfig
 from number_range_expander import NumberRangeExpander, RangeExpanderError
-from output_formatter import CsvStringFormatter, PythonListFormatter, PythonSetFormatter
+from output_formatter import CsvStringFormatter, OutputFormatter, PythonListFormatter, PythonSetFormatter
+from range_index import RangeIndex
+
+try:
+    import resource
+except ImportError:
+    resource = None
 
 class TestStage1BasicRangeExpansion(unittest.TestCase):
     def setUp(self):
@@ -356,6 +380,432 @@ class TestErrorHandling(unittest.TestCase):
         except RangeExpanderError as e:
             self.assertIn("Step value cannot be zero", str(e))
 
+class CountingFormatter(OutputFormatter):
+    def format(self, data):
+        """Consume the expanded data without storing it, returning how many numbers there were."""
+        return sum(1 for _ in data)
+
+
+class TestMemoryBudgetedExpansion(unittest.TestCase):
+    """Test memory-budgeted expansion with spill-to-disk merging."""
+    
+    def setUp(self):
+        """Set up test fixtures."""
+        # 64 bytes buffers a single value, so every input below spills runs
+        self.budget = 64
+        self.test_string = "40-30,5,1-12:3,7,20-25,5,-3,11-14,7"
+    
+    def test_merged_with_deduplication_matches_in_memory(self):
+        """Test merged and deduplicated output matches the in-memory result."""
+        in_memory = NumberRangeExpander(allow_merged=True, allow_deduplicate=True)
+        budgeted = NumberRangeExpander(
+            allow_merged=True, allow_deduplicate=True, memory_budget=self.budget
+        )
+        self.assertEqual(budgeted.expand(self.test_string), in_memory.expand(self.test_string))
+    
+    def test_merged_without_deduplication_keeps_duplicates(self):
+        """Test merged output keeps duplicates when deduplication is off."""
+        in_memory = NumberRangeExpander(allow_merged=True)
+        budgeted = NumberRangeExpander(allow_merged=True, memory_budget=self.budget)
+        self.assertEqual(budgeted.expand(self.test_string), in_memory.expand(self.test_string))
+    
+    def test_deduplication_preserves_order(self):
+        """Test order-preserving deduplication across spilled runs."""
+        in_memory = NumberRangeExpander(allow_deduplicate=True)
+        budgeted = NumberRangeExpander(allow_deduplicate=True, memory_budget=self.budget)
+        self.assertEqual(budgeted.expand(self.test_string), in_memory.expand(self.test_string))
+        self.assertEqual(budgeted.expand("5,1-3,2,7"), [5, 1, 2, 3, 7])
+    
+    def test_runs_are_spilled_to_disk(self):
+        """Test that exceeding the budget writes sorted runs to temporary files."""
+        expander = NumberRangeExpander(allow_merged=True, memory_budget=self.budget)
+        with mock.patch.object(
+            external_merge.tempfile, "mkstemp", wraps=external_merge.tempfile.mkstemp
+        ) as mkstemp:
+            result = expander.expand("100-1")
+        self.assertEqual(result, list(range(1, 101)))
+        self.assertGreater(mkstemp.call_count, 1)
+    
+    def test_budget_streams_into_output_formatters(self):
+        """Test budgeted output with CSV and set formatters."""
+        expander = NumberRangeExpander(
+            allow_merged=True,
+            allow_deduplicate=True,
+            memory_budget=self.budget,
+            output_formatter=CsvStringFormatter(),
+        )
+        self.assertEqual(expander.expand("3,1-2,2-4"), "1,2,3,4")
+        expander.output_formatter = PythonSetFormatter()
+        self.assertEqual(expander.expand("3,1-2,2-4"), {1, 2, 3, 4})
+    
+    def test_invalid_memory_budget(self):
+        """Test that an invalid memory budget is rejected when it is set."""
+        for budget in (0, -1, 1.5, True):
+            with self.assertRaises(RangeExpanderError) as context:
+                NumberRangeExpander(memory_budget=budget)
+            self.assertIn("Invalid memory budget", str(context.exception))
+        
+        expander = NumberRangeExpander(allow_merged=True)
+        with self.assertRaises(RangeExpanderError):
+            expander.memory_budget = -1
+        self.assertIsNone(expander.memory_budget)
+    
+    def test_many_runs_with_limited_open_files(self):
+        """Test that merging hundreds of runs stays under a low open-file limit."""
+        if resource is None:
+            self.skipTest("resource module not available")
+        
+        def limit_open_files():
+            resource.setrlimit(resource.RLIMIT_NOFILE, (48, 48))
+        
+        code = (
+            "import logging; logging.disable(logging.CRITICAL)\n"
+            "from number_range_expander import NumberRangeExpander\n"
+            "merged = NumberRangeExpander(allow_merged=True, memory_budget=512).expand('2000-1,5')\n"
+            "assert merged == sorted(list(range(1, 2001)) + [5]), merged[:10]\n"
+            "deduplicated = NumberRangeExpander(allow_deduplicate=True, memory_budget=1024).expand('5,2000-1')\n"
+            "assert deduplicated == [5] + [n for n in range(2000, 0, -1) if n != 5], deduplicated[:10]\n"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            preexec_fn=limit_open_files,
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+    
+    def test_peak_memory_within_budget(self):
+        """Test with tracemalloc that scattered literals stay within the memory budget."""
+        budget = 64 * 1024
+        # Allowance for fixed costs that do not grow with the input (temp dir, regex state)
+        fixed_overhead = 16 * 1024
+        rng = random.Random(7)
+        literals = rng.sample(range(-10 ** 12, 10 ** 12), 8000)
+        test_string = ",".join(map(str, literals + literals[:2000]))
+        
+        logging.disable(logging.DEBUG)
+        try:
+            for merged, deduplicate, expected in ((True, True, 8000), (True, False, 10000), (False, True, 8000)):
+                expander = NumberRangeExpander(
+                    allow_merged=merged,
+                    allow_deduplicate=deduplicate,
+                    memory_budget=budget,
+                    output_formatter=CountingFormatter(),
+                )
+                tracemalloc.start()
+                try:
+                    count = expander.expand(test_string)
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+                self.assertEqual(count, expected)
+                self.assertLessEqual(peak, budget + fixed_overhead, (merged, deduplicate))
+        finally:
+            logging.disable(logging.NOTSET)
+    
+    def test_value_outside_int64_range(self):
+        """Test that values which cannot be spilled as int64 raise a clear error."""
+        expander = NumberRangeExpander(allow_merged=True, memory_budget=self.budget)
+        with self.assertRaises(RangeExpanderError) as context:
+            expander.expand(str(2 ** 63))
+        self.assertIn("signed 64-bit", str(context.exception))
+
+class TestRangeIndex(unittest.TestCase):
+    """Test reverse lookup of stored expressions containing a number."""
+    
+    def setUp(self):
+        """Set up test fixtures."""
+        self.expressions = {
+            "web": "80,443,8000-8080",
+            "ssh": "22",
+            "evens": "0-100:2",
+            "countdown": "50-40",
+            "negative": "-10--1",
+        }
+        self.index = RangeIndex.build(self.expressions)
+    
+    def test_point_lookup(self):
+        """Test which expressions contain a single value."""
+        self.assertEqual(self.index.lookup(80), {"web", "evens"})
+        self.assertEqual(self.index.lookup(22), {"ssh", "evens"})
+        self.assertEqual(self.index.lookup(45), {"countdown"})
+        self.assertEqual(self.index.lookup(-5), {"negative"})
+        self.assertEqual(self.index.lookup(9000), set())
+    
+    def test_point_lookup_respects_step(self):
+        """Test that values between stepped members are not matched."""
+        self.assertEqual(self.index.lookup(21), set())
+        self.assertEqual(self.index.lookup(41), {"countdown"})
+    
+    def test_range_lookup(self):
+        """Test which expressions contain any value in a range."""
+        self.assertEqual(self.index.lookup_range(440, 450), {"web"})
+        self.assertEqual(self.index.lookup_range(101, 101), set())
+        self.assertEqual(self.index.lookup_range(-2, 0), {"negative", "evens"})
+        self.assertEqual(self.index.lookup_range(450, 440), {"web"})
+    
+    def test_add_and_remove(self):
+        """Test incremental add and remove of expressions."""
+        self.index.add("dns", "53")
+        self.assertEqual(self.index.lookup(53), {"dns"})
+        self.index.remove("web")
+        self.assertEqual(self.index.lookup(80), {"evens"})
+        self.assertNotIn("web", self.index)
+        self.assertEqual(len(self.index), 5)
+    
+    def test_many_incremental_changes_match_expansion(self):
+        """Test lookups stay correct across rebuilds triggered by many changes."""
+        expander = NumberRangeExpander()
+        index = RangeIndex()
+        expressions = {}
+        for i in range(200):
+            expressions[i] = f"{i}-{i + 20}:{i % 5 + 1},{-i}"
+            index.add(i, expressions[i])
+        for i in range(0, 200, 3):
+            index.remove(i)
+            del expressions[i]
+        for value in range(-50, 250, 7):
+            expected = {key for key, expression in expressions.items() if value in expander.expand(expression)}
+            self.assertEqual(index.lookup(value), expected)
+    
+    def test_sequential_adds_keep_tree_balanced(self):
+        """Test that many monotonic adds cannot degrade the tree into a chain."""
+        def depth(node):
+            return 0 if node is None else 1 + max(depth(node.left), depth(node.right))
+        
+        index = RangeIndex.build({i: f"{i * 10}-{i * 10 + 5}" for i in range(2000)})
+        for i in range(2000, 6000):
+            index.add(i, f"{i * 10}-{i * 10 + 5}")
+        self.assertLessEqual(depth(index._root), math.log(6000, 1.5) + 1)
+        self.assertEqual(index.lookup(45002), {4500})
+    
+    def test_duplicate_and_missing_keys(self):
+        """Test errors for adding an existing key or removing a missing one."""
+        with self.assertRaises(RangeExpanderError):
+            self.index.add("ssh", "2222")
+        with self.assertRaises(RangeExpanderError):
+            self.index.remove("ftp")
+    
+    def test_save_and_load(self):
+        """Test that a saved index answers the same queries after loading."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "index.json")
+            self.index.save(path)
+            loaded = RangeIndex.load(path)
+        self.assertEqual(len(loaded), len(self.index))
+        self.assertEqual(loaded.expression("web"), self.expressions["web"])
+        for value in (22, 41, 80, 8010, -5, 9000):
+            self.assertEqual(loaded.lookup(value), self.index.lookup(value))
+    
+    def test_load_invalid_file(self):
+        """Test that loading a file that is not a saved index fails clearly."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "index.json")
+            with open(path, "w") as handle:
+                handle.write("[1, 2, 3]")
+            with self.assertRaises(RangeExpanderError) as context:
+                RangeIndex.load(path)
+        self.assertIn("Invalid range index file", str(context.exception))
+    
+    def test_load_rejects_invalid_intervals(self):
+        """Test that malformed intervals are rejected when loading."""
+        bad_intervals = ([1, 10, 0], [10, 1, 1], [1.5, 10, 1], [1, 10, -2], [1, 10], [True, 10, 1])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "index.json")
+            for interval in bad_intervals:
+                with open(path, "w") as handle:
+                    json.dump({
+                        "format": "range_index",
+                        "version": 1,
+                        "entries": [{"key": "bad", "expression": "1-10", "intervals": [interval]}],
+                    }, handle)
+                with self.assertRaises(RangeExpanderError) as context:
+                    RangeIndex.load(path)
+                self.assertIn("Invalid range index file", str(context.exception))
+    
+    def test_save_rejects_unsupported_keys(self):
+        """Test that keys which cannot be reloaded are rejected before writing."""
+        self.index.add(("customer", 1), "1-5")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "index.json")
+            with self.assertRaises(RangeExpanderError) as context:
+                self.index.save(path)
+            self.assertFalse(os.path.exists(path))
+        self.assertIn("must be a string or integer", str(context.exception))
+
+
+class TestThreadSafeConfiguration(unittest.TestCase):
+    """Test immutable configuration and sharing one expander across threads."""
+    
+    def setUp(self):
+        """Set up test fixtures."""
+        self.config = ExpanderConfig(delimiters=["-", ".."], allow_merged=True)
+        self.test_string = "10..12,1-3:2,-4--2,7"
+        self.expected = [-4, -3, -2, 1, 3, 7, 10, 11, 12]
+    
+    def test_config_is_immutable(self):
+        """Test that config attributes cannot be changed or added."""
+        with self.assertRaises(AttributeError):
+            self.config.allow_merged = False
+        with self.assertRaises(AttributeError):
+            self.config.extra = True
+        self.assertIsInstance(self.config.delimiters, tuple)
+    
+    def test_config_is_hashable_and_comparable(self):
+        """Test that equal settings give equal configs with equal hashes."""
+        same = ExpanderConfig(delimiters=("-", ".."), allow_merged=True, output_formatter=PythonListFormatter())
+        self.assertEqual(self.config, same)
+        self.assertEqual(hash(self.config), hash(same))
+        self.assertNotEqual(self.config, self.config.replace(allow_merged=False))
+        self.assertEqual(len({self.config, same}), 1)
+    
+    def test_stateful_formatters_compare_by_identity(self):
+        """Test that configs with different stateful formatters are not equal."""
+        class SeparatorFormatter(OutputFormatter):
+            def __init__(self, separator):
+                self.separator = separator
+            
+            def format(self, data):
+                return self.separator.join(map(str, data))
+        
+        comma = self.config.replace(output_formatter=SeparatorFormatter(","))
+        pipe = self.config.replace(output_formatter=SeparatorFormatter("|"))
+        self.assertNotEqual(comma, pipe)
+        self.assertEqual(comma, comma.replace())
+        self.assertEqual(CsvStringFormatter(), CsvStringFormatter())
+        self.assertNotEqual(CsvStringFormatter(), PythonListFormatter())
+    
+    def test_config_supports_copy_and_pickle(self):
+        """Test that configs can be copied and pickled, e.g. for process pools."""
+        config = self.config.replace(memory_budget=1024, output_formatter=CsvStringFormatter())
+        for clone in (copy.copy(config), copy.deepcopy(config), pickle.loads(pickle.dumps(config))):
+            self.assertEqual(clone, config)
+            self.assertEqual(hash(clone), hash(config))
+            self.assertEqual(NumberRangeExpander(config=clone).expand("1-3"), "1,2,3")
+    
+    def test_unhashable_settings_are_accepted(self):
+        """Test that unhashable settings only fail when the config is hashed."""
+        @dataclass
+        class SeparatorFormatter(OutputFormatter):
+            separator: str
+            
+            def format(self, data):
+                return self.separator.join(map(str, data))
+        
+        expander = NumberRangeExpander(output_formatter=SeparatorFormatter("|"))
+        self.assertEqual(expander.expand("1-3"), "1|2|3")
+        with self.assertRaises(TypeError):
+            hash(expander.config)
+        
+        expander = NumberRangeExpander(output_formatter={})
+        with self.assertRaises(RangeExpanderError) as context:
+            expander.expand("1-3")
+        self.assertIn("Invalid output formatter", str(context.exception))
+    
+    def test_config_validates_settings(self):
+        """Test that invalid settings are rejected when the config is built."""
+        for budget in (-5, [1]):
+            with self.assertRaises(RangeExpanderError) as context:
+                ExpanderConfig(memory_budget=budget)
+            self.assertIn("Invalid memory budget", str(context.exception))
+        with self.assertRaises(RangeExpanderError):
+            self.config.replace(memory_budget=0)
+    
+    def test_keywords_override_shared_config(self):
+        """Test that settings passed alongside a config override it."""
+        shared = ExpanderConfig()
+        expander = NumberRangeExpander(allow_merged=True, config=shared)
+        self.assertEqual(expander.expand("3,1"), [1, 3])
+        self.assertFalse(shared.allow_merged)
+        self.assertEqual(NumberRangeExpander(config=shared).expand("3,1"), [3, 1])
+    
+    def test_replace_returns_new_config(self):
+        """Test that replace leaves the original config untouched."""
+        csv_config = self.config.replace(output_formatter=CsvStringFormatter())
+        self.assertIsInstance(self.config.output_formatter, PythonListFormatter)
+        self.assertIsInstance(csv_config.output_formatter, CsvStringFormatter)
+    
+    def test_expander_from_shared_config(self):
+        """Test building expanders from a shared config."""
+        expander = NumberRangeExpander(config=self.config)
+        self.assertIs(expander.config, self.config)
+        self.assertEqual(expander.expand(self.test_string), self.expected)
+    
+    def test_attribute_assignment_swaps_config(self):
+        """Test that assigning a setting replaces the config instead of mutating it."""
+        expander = NumberRangeExpander(config=self.config)
+        expander.output_formatter = CsvStringFormatter()
+        self.assertIsNot(expander.config, self.config)
+        self.assertIsInstance(self.config.output_formatter, PythonListFormatter)
+        self.assertEqual(expander.expand("1-3"), "1,2,3")
+    
+    def test_default_delimiters_are_not_shared_mutable_state(self):
+        """Test that the default delimiters cannot be mutated through an expander."""
+        expander = NumberRangeExpander()
+        with self.assertRaises(AttributeError):
+            expander.delimiters.append("|")
+        self.assertEqual(NumberRangeExpander().expand("1~2"), [1, 2])
+    
+    def test_concurrent_expand_on_shared_expander(self):
+        """Stress test concurrent expand() calls while settings are reassigned."""
+        expander = NumberRangeExpander(config=self.config)
+        csv_expected = ",".join(map(str, self.expected))
+        stop = threading.Event()
+        
+        def toggle_formatter():
+            formatters = [CsvStringFormatter(), PythonListFormatter()]
+            count = 0
+            while not stop.is_set():
+                expander.output_formatter = formatters[count % 2]
+                count += 1
+        
+        def worker(_):
+            for _ in range(50):
+                result = expander.expand(self.test_string)
+                # Each call sees one whole config, never a mix of two
+                self.assertIn(result, (self.expected, csv_expected))
+        
+        toggler = threading.Thread(target=toggle_formatter)
+        toggler.start()
+        try:
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                list(pool.map(worker, range(16)))
+        finally:
+            stop.set()
+            toggler.join()
+    
+    @unittest.skipUnless(
+        getattr(sys, "_is_gil_enabled", lambda: True)() is False,
+        "thread scaling is only expected on free-threaded Python builds",
+    )
+    def test_throughput_scales_across_threads(self):
+        """Test that a shared expander scales with threads when the GIL is disabled."""
+        threads = 4
+        if (os.cpu_count() or 1) < threads:
+            self.skipTest(f"needs at least {threads} CPUs")
+        
+        expander = NumberRangeExpander(config=self.config)
+        calls_per_thread = 2000
+        
+        def calls_per_second(workers):
+            def worker(_):
+                for _ in range(calls_per_thread):
+                    self.assertEqual(expander.expand(self.test_string), self.expected)
+            
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(worker, range(workers)))
+            return workers * calls_per_thread / (time.perf_counter() - started)
+        
+        # Keep per-call debug logging out of the measurement
+        logging.disable(logging.DEBUG)
+        try:
+            single = calls_per_second(1)
+            parallel = calls_per_second(threads)
+        finally:
+            logging.disable(logging.NOTSET)
+        self.assertGreater(parallel, 1.5 * single)
 
 if __name__ == "__main__":
     # Create a test suite with all test cases
@@ -371,7 +821,10 @@ if __name__ == "__main__":
         TestStage6DuplicateAndOverlappingRangeHandling,
         TestStage7OutputFormatControl,
         TestEdgeCasesAndComplexScenarios,
-        TestErrorHandling
+        TestErrorHandling,
+        TestMemoryBudgetedExpansion,
+        TestRangeIndex,
+        TestThreadSafeConfiguration
     ]
     
     for test_class in test_classes: